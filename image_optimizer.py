@@ -1,8 +1,24 @@
 import os
 import sys
-from PIL import Image, ImageOps
+import time
+import shutil
+import io
+import zlib
+import hashlib
+import json
+import signal
+import socket
+import threading
+import uuid
+from PIL import Image, ImageOps, ImageSequence
 import argparse
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import numpy as np
+except ImportError:  # Duplicate detection and the SSIM floor are disabled without NumPy
+    np = None
 
 class ImageOptimizer:
     def __init__(self):
@@ -10,7 +26,31 @@ class ImageOptimizer:
             'JPEG': ['.jpg', '.jpeg'],
             'PNG': ['.png'],
             'WEBP': ['.webp'],
-            'AVIF': ['.avif']
+            'AVIF': ['.avif'],
+            'GIF': ['.gif']
+        }
+        # Formats whose size depends on the quality setting
+        self.lossy_formats = ['JPEG', 'WEBP', 'AVIF']
+        # Formats that can be written as animations
+        self.animated_formats = ['WEBP', 'GIF', 'PNG']
+        # Metadata policies: keep everything, strip everything,
+        # keep only the ICC profile, or keep ICC plus authorship tags
+        self.metadata_policies = ['keep', 'strip', 'icc', 'copyright']
+        self.copyright_tags = [0x013B, 0x8298]  # Artist, Copyright
+        self.max_metadata_block = 4096  # Drop XMP/MakerNote blocks above 4 KB
+        self.duplicate_tolerance = 3  # Mean thumbnail difference (0-255) for near duplicates
+        self.duplicate_block_tolerance = 12  # Worst 8x8 block difference (0-255) at full size
+        self.queue_buckets = 256  # Queue work units (by file size) when deduplicating
+        # Pillow's animation writers buffer every frame, so cap the total
+        # output pixels (about 400 MB as RGBA)
+        self.max_animation_pixels = 100_000_000
+        # Metadata blocks each output format actually writes
+        self.metadata_fields = {
+            'JPEG': ['exif', 'icc_profile', 'xmp'],
+            'PNG': ['exif', 'icc_profile'],
+            'WEBP': ['exif', 'icc_profile', 'xmp'],
+            'AVIF': ['exif', 'icc_profile', 'xmp'],
+            'GIF': []
         }
     
     def get_file_size_kb(self, filepath):
@@ -19,7 +59,7 @@ class ImageOptimizer:
     
     def optimize_image(self, input_path, output_path=None, target_size_kb=None, 
                       quality=85, max_width=None, max_height=None, 
-                      output_format=None, aspect_ratio=None):
+                      output_format=None, aspect_ratio=None, metadata='icc', min_ssim=None):
         """
         Optimize image with multiple compression techniques
         
@@ -30,12 +70,34 @@ class ImageOptimizer:
             quality: JPEG/WEBP quality (1-100)
             max_width: Maximum width in pixels
             max_height: Maximum height in pixels
-            output_format: Output format (JPEG, PNG, WEBP, AVIF)
+            output_format: Output format (JPEG, PNG, WEBP, AVIF, GIF)
             aspect_ratio: Tuple (width, height) for aspect ratio
+            metadata: Metadata policy (keep, strip, icc, copyright)
+            min_ssim: Minimum SSIM (0-1) for the target-size search to accept
+                (still images only)
         """
         try:
             # Open and process image
             with Image.open(input_path) as img:
+                # Stream animated inputs frame by frame instead of keeping only the first
+                if self.is_animated(img) and output_format in self.animated_formats:
+                    if not output_path:
+                        output_path = self.get_default_output_path(input_path, output_format)
+                    if min_ssim is not None:
+                        print("⚠️  The SSIM quality floor is not supported for animations, "
+                              "ignoring it")
+                    metadata_kwargs = self.optimize_animation(
+                        img, output_path, target_size_kb, quality, max_width, max_height,
+                        output_format, aspect_ratio, metadata
+                    )
+                    self.report_results(input_path, output_path, metadata_kwargs, metadata,
+                                        output_format)
+                    return str(output_path)
+                
+                # Apply EXIF orientation once, before any cropping or resizing
+                img = ImageOps.exif_transpose(img)
+                metadata_kwargs = self.prepare_metadata(img, metadata)
+                
                 # Convert to RGB if necessary
                 if img.mode in ('RGBA', 'LA', 'P'):
                     if output_format in ['JPEG']:
@@ -49,6 +111,8 @@ class ImageOptimizer:
                         img = img.convert('RGBA')
                 elif img.mode != 'RGB':
                     img = img.convert('RGB')
+                # A CMYK or grey profile no longer describes converted pixels
+                metadata_kwargs = self.match_icc_to_mode(metadata_kwargs, img.mode)
                 
                 original_size = img.size
                 print(f"Original size: {original_size[0]}x{original_size[1]}")
@@ -68,34 +132,265 @@ class ImageOptimizer:
                     output_format = 'JPEG'  # Default to JPEG for best compression
                 
                 if not output_path:
-                    input_stem = Path(input_path).stem
-                    input_dir = Path(input_path).parent
-                    ext = self.get_extension_for_format(output_format)
-                    output_path = input_dir / f"{input_stem}_optimized{ext}"
+                    output_path = self.get_default_output_path(input_path, output_format)
                 
-                # Optimize based on target size
-                if target_size_kb:
-                    self.compress_to_target_size(img, output_path, target_size_kb, output_format)
+                # Optimize based on target size and quality floor
+                ssim = None
+                if target_size_kb or min_ssim is not None:
+                    ssim = self.compress_to_target_size(img, output_path, target_size_kb,
+                                                        output_format, metadata_kwargs, min_ssim)
                 else:
-                    self.save_with_quality(img, output_path, quality, output_format)
-                
-                # Report results
-                final_size_kb = self.get_file_size_kb(output_path)
-                compression_ratio = (1 - final_size_kb / self.get_file_size_kb(input_path)) * 100
-                
-                print(f"✅ Optimization complete!")
-                print(f"Input: {input_path}")
-                print(f"Output: {output_path}")
-                print(f"Original size: {self.get_file_size_kb(input_path):.1f} KB")
-                print(f"Final size: {final_size_kb:.1f} KB")
-                print(f"Compression: {compression_ratio:.1f}% reduction")
+                    self.save_with_quality(img, output_path, quality, output_format, metadata_kwargs)
                 
+                self.report_results(input_path, output_path, metadata_kwargs, metadata,
+                                    output_format, ssim)
                 return str(output_path)
                 
         except Exception as e:
             print(f"❌ Error processing {input_path}: {str(e)}")
             return None
     
+    def get_default_output_path(self, input_path, output_format):
+        """Get <stem>_optimized<ext> next to the input"""
+        input_stem = Path(input_path).stem
+        input_dir = Path(input_path).parent
+        ext = self.get_extension_for_format(output_format)
+        return input_dir / f"{input_stem}_optimized{ext}"
+    
+    def report_results(self, input_path, output_path, metadata_kwargs, metadata,
+                       output_format=None, ssim=None):
+        """Print size and compression summary for one image"""
+        final_size_kb = self.get_file_size_kb(output_path)
+        compression_ratio = (1 - final_size_kb / self.get_file_size_kb(input_path)) * 100
+        
+        print(f"✅ Optimization complete!")
+        print(f"Input: {input_path}")
+        print(f"Output: {output_path}")
+        print(f"Original size: {self.get_file_size_kb(input_path):.1f} KB")
+        print(f"Final size: {final_size_kb:.1f} KB")
+        metadata_kb = self.get_metadata_size_kb(metadata_kwargs, output_format)
+        print(f"Metadata: {metadata_kb:.1f} KB ({metadata})")
+        print(f"Compression: {compression_ratio:.1f}% reduction")
+        if ssim is not None:
+            print(f"SSIM: {ssim:.4f}")
+    
+    def is_animated(self, img):
+        """Check whether an opened image has more than one frame"""
+        return getattr(img, 'is_animated', False) and getattr(img, 'n_frames', 1) > 1
+    
+    def optimize_animation(self, img, output_path, target_size_kb=None, quality=85,
+                           max_width=None, max_height=None, output_format='WEBP',
+                           aspect_ratio=None, metadata='icc'):
+        """
+        Optimize an animated image (GIF/APNG/WEBP) one frame at a time
+        
+        Frames are decoded, cropped and resized one at a time as the encoder
+        asks for them. Pillow's GIF, APNG and WEBP writers still keep every
+        frame they receive until the file is written, so animations whose
+        output frames exceed max_animation_pixels are refused; lower
+        max_width/max_height or set a target size so frames are sampled.
+        
+        Returns:
+            Metadata save arguments written to the output
+        """
+        metadata_kwargs = self.prepare_metadata(img, metadata)
+        # Frames are converted to RGBA before encoding
+        metadata_kwargs = self.match_icc_to_mode(metadata_kwargs, 'RGBA')
+        print(f"Original size: {img.size[0]}x{img.size[1]}, {img.n_frames} frames")
+        
+        geometry = {'aspect_ratio': aspect_ratio, 'max_width': max_width, 'max_height': max_height}
+        if target_size_kb:
+            self.compress_animation_to_target_size(img, output_path, target_size_kb, output_format,
+                                                   metadata_kwargs, geometry)
+        else:
+            self.save_animation(img, output_path, quality, output_format, metadata_kwargs, geometry)
+        return metadata_kwargs
+    
+    def iter_frames(self, img, geometry, frame_step=1, colors=None):
+        """
+        Yield transformed frames of an animation, keeping every frame_step-th frame
+        
+        Each frame is held back until the next kept frame is found, so its
+        info['duration'] can include the durations of the skipped frames.
+        """
+        previous = None
+        for index, frame in enumerate(ImageSequence.Iterator(img)):
+            duration = frame.info.get('duration', 100)
+            if index % frame_step:
+                previous.info['duration'] += duration
+                continue
+            if previous is not None:
+                yield previous
+            
+            frame = ImageOps.exif_transpose(frame.convert('RGBA'))
+            if geometry.get('aspect_ratio'):
+                frame = self.change_aspect_ratio(frame, geometry['aspect_ratio'])
+            if geometry.get('max_width') or geometry.get('max_height'):
+                frame = self.resize_image(frame, geometry.get('max_width'), geometry.get('max_height'))
+            if colors:
+                frame = self.quantize_frame(frame, colors)
+            frame.info['duration'] = duration
+            previous = frame
+        if previous is not None:
+            yield previous
+    
+    def quantize_frame(self, frame, colors):
+        """Quantize an RGBA frame for GIF, reserving a transparent palette index"""
+        alpha = frame.getchannel('A')
+        if alpha.getextrema()[0] >= 128:
+            return frame.convert('RGB').quantize(colors, method=Image.Quantize.FASTOCTREE)
+        
+        # GIF transparency is binary: pixels under half alpha use the last index
+        transparent_index = colors - 1
+        paletted = frame.convert('RGB').quantize(transparent_index,
+                                                 method=Image.Quantize.FASTOCTREE)
+        palette = paletted.getpalette()[:3 * transparent_index]
+        palette += [0, 0, 0] * (colors - len(palette) // 3)
+        paletted.putpalette(palette)
+        paletted.paste(transparent_index, mask=alpha.point(lambda a: 255 if a < 128 else 0))
+        paletted.info['transparency'] = transparent_index
+        return paletted
+    
+    def save_animation(self, img, output_path, quality, output_format, metadata=None,
+                       geometry=None, frame_step=1):
+        """Encode an animation with specified quality and frame sampling"""
+        # GIF has no quality setting, so quality maps to palette size
+        colors = max(16, int(256 * quality / 100)) if output_format == 'GIF' else None
+        
+        frames = self.iter_frames(img, geometry or {}, frame_step, colors)
+        first_frame = next(frames)
+        
+        frame_count = -(-img.n_frames // frame_step)
+        total_pixels = first_frame.width * first_frame.height * frame_count
+        if total_pixels > self.max_animation_pixels:
+            raise MemoryError(f"Animation too large to encode in memory: {frame_count} frames of "
+                             f"{first_frame.width}x{first_frame.height} exceed "
+                             f"{self.max_animation_pixels:,} pixels; reduce size or set a target")
+        
+        save_kwargs = {
+            'format': output_format,
+            'save_all': True,
+            'append_images': frames
+        }
+        if output_format in ['PNG', 'WEBP']:
+            # The APNG writer scans append_images twice and the WEBP writer
+            # takes a single duration list, so both need every frame up front
+            frames = list(frames)
+            save_kwargs['append_images'] = frames
+        if output_format == 'WEBP':
+            save_kwargs['duration'] = [frame.info['duration'] for frame in [first_frame] + frames]
+        # GIF and APNG read each frame's info['duration'] as it is written
+        
+        # A GIF without a loop count plays once; keep that instead of looping forever
+        if 'loop' in img.info:
+            save_kwargs['loop'] = img.info['loop']
+        elif output_format != 'GIF':
+            save_kwargs['loop'] = 1
+        
+        if output_format == 'WEBP':
+            save_kwargs.update({'quality': quality, 'method': 6, 'minimize_size': True})
+        elif output_format in ['GIF', 'PNG']:
+            save_kwargs['optimize'] = True
+        if output_format == 'GIF' and (img.mode in ('RGBA', 'LA', 'PA') or
+                                       'transparency' in img.info):
+            # Clear each frame before the next so transparent areas stay transparent
+            save_kwargs['disposal'] = 2
+        
+        if metadata:
+            save_kwargs.update(metadata)
+        
+        first_frame.save(output_path, **save_kwargs)
+    
+    def compress_animation_to_target_size(self, img, output_path, target_kb, output_format,
+                                          metadata=None, geometry=None):
+        """Compress animation to target file size by lowering quality, then dropping frames"""
+        # APNG is lossless, so only frame sampling can shrink it
+        qualities = [85] if output_format == 'PNG' else [90, 75, 60, 45, 30, 15]
+        
+        budget_error = None
+        current_size_kb = None
+        for frame_step in range(1, 5):
+            for quality in qualities:
+                try:
+                    self.save_animation(img, output_path, quality, output_format, metadata,
+                                        geometry, frame_step)
+                except MemoryError as e:
+                    # Too many frames to buffer; sampling more frames may fit
+                    budget_error = e
+                    break
+                current_size_kb = self.get_file_size_kb(output_path)
+                
+                if current_size_kb <= target_kb:
+                    print(f"Target size achieved at quality {quality}, keeping every "
+                          f"{frame_step} frame(s)")
+                    return
+        
+        if current_size_kb is None:
+            raise budget_error
+        print(f"⚠️  Could not reach target size. Final size: {current_size_kb:.1f} KB")
+    
+    def prepare_metadata(self, img, policy='icc'):
+        """Build save arguments for EXIF/ICC/XMP according to a metadata policy"""
+        if policy not in self.metadata_policies:
+            raise ValueError(f"Unknown metadata policy: {policy}")
+        
+        # Start from an explicit empty set so nothing leaks through img.info
+        metadata_kwargs = {'exif': b'', 'icc_profile': b'', 'xmp': b''}
+        if policy == 'strip':
+            return metadata_kwargs
+        
+        metadata_kwargs['icc_profile'] = img.info.get('icc_profile') or b''
+        if policy == 'icc':
+            return metadata_kwargs
+        
+        # Re-serializing EXIF drops the embedded thumbnail (IFD1)
+        exif = img.getexif()
+        if policy == 'copyright':
+            for tag in list(exif.keys()):
+                if tag not in self.copyright_tags:
+                    del exif[tag]
+        else:
+            exif_ifd = exif.get_ifd(0x8769)
+            maker_note = exif_ifd.get(0x927C)
+            if maker_note is not None and len(maker_note) > self.max_metadata_block:
+                del exif_ifd[0x927C]
+            xmp = img.info.get('xmp') or b''
+            if len(xmp) <= self.max_metadata_block:
+                metadata_kwargs['xmp'] = xmp
+        
+        if len(exif):
+            metadata_kwargs['exif'] = exif.tobytes()
+        return metadata_kwargs
+    
+    def match_icc_to_mode(self, metadata_kwargs, mode):
+        """Drop an ICC profile whose colour space does not match the image mode"""
+        profile = metadata_kwargs.get('icc_profile')
+        if not profile:
+            return metadata_kwargs
+        # Bytes 16-20 of an ICC header hold the data colour space signature
+        color_space = profile[16:20]
+        expected = b'GRAY' if Image.getmodebase(mode) == 'L' else b'RGB '
+        if color_space != expected:
+            return dict(metadata_kwargs, icc_profile=b'')
+        return metadata_kwargs
+    
+    def get_metadata_size_kb(self, metadata_kwargs, output_format=None):
+        """Get size of the metadata blocks written to the output in KB"""
+        if not metadata_kwargs:
+            return 0
+        # Formats drop blocks they cannot store (e.g. GIF stores none)
+        fields = self.metadata_fields.get(output_format, list(metadata_kwargs))
+        size = 0
+        for key, value in metadata_kwargs.items():
+            if key not in fields or not value:
+                continue
+            if output_format == 'PNG' and key == 'icc_profile':
+                # PNG stores the profile zlib-compressed in an iCCP chunk
+                size += len(zlib.compress(value))
+            else:
+                size += len(value)
+        return size / 1024
+    
     def change_aspect_ratio(self, img, aspect_ratio):
         """Change image aspect ratio by cropping"""
         target_width, target_height = aspect_ratio
@@ -131,13 +426,23 @@ class ImageOptimizer:
         
         return img.resize((width, height), Image.Resampling.LANCZOS)
     
-    def compress_to_target_size(self, img, output_path, target_kb, output_format):
-        """Compress image to target file size"""
+    def compress_to_target_size(self, img, output_path, target_kb, output_format, metadata=None,
+                                min_ssim=None):
+        """
+        Compress image to target file size (metadata bytes count towards the target)
+        
+        With min_ssim, returns the SSIM of the chosen encoding (see
+        compress_with_quality_floor); otherwise returns None.
+        """
+        if min_ssim is not None:
+            return self.compress_with_quality_floor(img, output_path, target_kb, output_format,
+                                                    metadata, min_ssim)
+        
         quality = 95
         min_quality = 10
         
         while quality >= min_quality:
-            self.save_with_quality(img, output_path, quality, output_format)
+            self.save_with_quality(img, output_path, quality, output_format, metadata)
             current_size_kb = self.get_file_size_kb(output_path)
             
             if current_size_kb <= target_kb:
@@ -155,7 +460,8 @@ class ImageOptimizer:
             new_size = (int(temp_img.width * scale_factor), int(temp_img.height * scale_factor))
             resized_img = temp_img.resize(new_size, Image.Resampling.LANCZOS)
             
-            self.save_with_quality(resized_img, output_path, max(quality, 20), output_format)
+            self.save_with_quality(resized_img, output_path, max(quality, 20), output_format,
+                                   metadata)
             current_size_kb = self.get_file_size_kb(output_path)
             
             if current_size_kb <= target_kb:
@@ -166,8 +472,135 @@ class ImageOptimizer:
         
         print(f"⚠️  Could not reach target size. Final size: {current_size_kb:.1f} KB")
     
-    def save_with_quality(self, img, output_path, quality, output_format):
-        """Save image with specified quality and format"""
+    def get_luma_plane(self, img):
+        """Get the full-resolution luma plane as a uint8 array for SSIM"""
+        # Downsampling would hide the compression artifacts being measured
+        return np.asarray(img.convert('L'))
+    
+    def compute_ssim(self, reference, candidate, window=7, band_rows=256):
+        """Compute mean SSIM between two luma planes of equal shape"""
+        c1 = (0.01 * 255) ** 2
+        c2 = (0.03 * 255) ** 2
+        window = min(window, *reference.shape)
+        
+        def box_mean(plane):
+            # Sliding window means from a summed-area table
+            table = np.pad(plane, ((1, 0), (1, 0))).cumsum(axis=0).cumsum(axis=1)
+            sums = (table[window:, window:] - table[:-window, window:]
+                    - table[window:, :-window] + table[:-window, :-window])
+            return sums / (window * window)
+        
+        # Work in overlapping bands of rows so large images stay within memory
+        total = 0.0
+        count = 0
+        for top in range(0, reference.shape[0] - window + 1, band_rows):
+            rows = slice(top, top + band_rows + window - 1)
+            x = reference[rows].astype(np.float64)
+            y = candidate[rows].astype(np.float64)
+            mu_x = box_mean(x)
+            mu_y = box_mean(y)
+            var_x = box_mean(x * x) - mu_x * mu_x
+            var_y = box_mean(y * y) - mu_y * mu_y
+            cov = box_mean(x * y) - mu_x * mu_y
+            
+            ssim_map = ((2 * mu_x * mu_y + c1) * (2 * cov + c2)) / \
+                       ((mu_x * mu_x + mu_y * mu_y + c1) * (var_x + var_y + c2))
+            total += ssim_map.sum()
+            count += ssim_map.size
+        return float(total / count)
+    
+    def encode_candidate(self, img, quality, output_format, metadata, reference):
+        """Encode image in memory and score it against the reference luma plane"""
+        buffer = io.BytesIO()
+        self.save_with_quality(img, buffer, quality, output_format, metadata)
+        data = buffer.getvalue()
+        
+        with Image.open(io.BytesIO(data)) as decoded:
+            luma = decoded.convert('L')
+            # Candidates at reduced scale are compared at the reference resolution
+            size = (reference.shape[1], reference.shape[0])
+            luma = luma.resize(size, Image.Resampling.BOX)
+            candidate = np.asarray(luma)
+        return data, self.compute_ssim(reference, candidate)
+    
+    def compress_with_quality_floor(self, img, output_path, target_kb, output_format,
+                                    metadata=None, min_ssim=0.95):
+        """
+        Find the smallest encoding whose SSIM stays at or above min_ssim
+        
+        Quality is binary searched in memory, scoring each candidate
+        against the luma plane of the source. Resolution is only
+        reduced if the target size is still not met, and never below the floor.
+        
+        Returns:
+            SSIM of the saved encoding
+        """
+        if np is None:
+            raise ImportError("NumPy is required for the SSIM quality floor")
+        if not 0 < min_ssim <= 1:
+            raise ValueError(f"min_ssim must be in (0, 1], got {min_ssim}")
+        
+        reference = self.get_luma_plane(img)
+        candidates = {}
+        
+        def score(quality):
+            if quality not in candidates:
+                candidates[quality] = self.encode_candidate(img, quality, output_format,
+                                                            metadata, reference)
+            return candidates[quality][1]
+        
+        # SSIM rises with quality, so binary search for the lowest passing quality
+        low, high = 10, 95
+        if output_format not in self.lossy_formats:
+            # Quality is ignored, so every candidate would be identical
+            low = high
+        elif score(high) < min_ssim:
+            print(f"⚠️  Quality floor not reachable (SSIM {score(high):.4f} at quality {high})")
+            low = high
+        while low < high:
+            middle = (low + high) // 2
+            if score(middle) >= min_ssim:
+                high = middle
+            else:
+                low = middle + 1
+        quality = high
+        score(quality)
+        data, ssim = candidates[quality]
+        if output_format not in self.lossy_formats:
+            print(f"{output_format} ignores quality, skipping the search (SSIM {ssim:.4f})")
+        else:
+            print(f"Quality floor SSIM {min_ssim} met at quality {quality} (SSIM {ssim:.4f})")
+        
+        # If still too large, try resizing while the floor holds
+        if target_kb and len(data) / 1024 > target_kb:
+            print("Quality floor reached before target size, trying size reduction...")
+            scale_factor = 0.9
+            while scale_factor >= 0.3:
+                new_size = (int(img.width * scale_factor), int(img.height * scale_factor))
+                resized_img = img.resize(new_size, Image.Resampling.LANCZOS)
+                resized_data, resized_ssim = self.encode_candidate(
+                    resized_img, quality, output_format, metadata, reference
+                )
+                if resized_ssim < min_ssim:
+                    break
+                data, ssim = resized_data, resized_ssim
+                
+                if len(data) / 1024 <= target_kb:
+                    print(f"Target size achieved with {scale_factor:.1%} scaling")
+                    break
+                
+                scale_factor -= 0.1
+            
+            if len(data) / 1024 > target_kb:
+                print(f"⚠️  Could not reach target size above the quality floor. "
+                      f"Final size: {len(data) / 1024:.1f} KB")
+        
+        with open(output_path, 'wb') as f:
+            f.write(data)
+        return ssim
+    
+    def save_with_quality(self, img, output_path, quality, output_format, metadata=None):
+        """Save image with specified quality, format and metadata"""
         save_kwargs = {}
         
         if output_format == 'JPEG':
@@ -195,6 +628,14 @@ class ImageOptimizer:
                 'quality': quality,
                 'optimize': True
             }
+        elif output_format == 'GIF':
+            save_kwargs = {
+                'format': 'GIF',
+                'optimize': True
+            }
+        
+        if metadata:
+            save_kwargs.update(metadata)
         
         img.save(output_path, **save_kwargs)
     
@@ -204,12 +645,356 @@ class ImageOptimizer:
             'JPEG': '.jpg',
             'PNG': '.png',
             'WEBP': '.webp',
-            'AVIF': '.avif'
+            'AVIF': '.avif',
+            'GIF': '.gif'
         }
         return extensions.get(format_name, '.jpg')
     
-    def batch_optimize(self, input_folder, output_folder=None, **kwargs):
-        """Optimize all images in a folder"""
+    def get_content_hash(self, filepath):
+        """Get SHA-256 of file contents (exact duplicate key)"""
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+    
+    def get_image_fingerprint(self, filepath):
+        """
+        Get the perceptual fingerprint of an image for near-duplicate checks
+        
+        Returns:
+            Tuple (dHash as uint64, (width, height), 16x16 RGBA thumbnail array),
+            or None for animations, which are only matched exactly
+        """
+        with Image.open(filepath) as img:
+            if self.is_animated(img):
+                return None
+            # Full displayed size, read before draft() shrinks the decode
+            width, height = img.size
+            if img.getexif().get(0x0112) in (5, 6, 7, 8):
+                width, height = height, width
+            img.draft('RGB', (64, 64))  # Let JPEG decode at reduced scale
+            img = ImageOps.exif_transpose(img)
+            luma = img.convert('L').resize((9, 8), Image.Resampling.BILINEAR)
+            pixels = np.asarray(luma, dtype=np.int16)
+            thumbnail = img.convert('RGBA').resize((16, 16), Image.Resampling.BOX)
+            thumbnail = np.asarray(thumbnail, dtype=np.int16)
+        bits = (pixels[:, 1:] > pixels[:, :-1]).ravel()
+        return int(np.packbits(bits).view('>u8')[0]), (width, height), thumbnail
+    
+    def find_duplicates(self, image_files, threshold=None):
+        """
+        Group exact and, optionally, near-exact duplicate images
+        
+        Near duplicates must be within the dHash threshold of the group's
+        first image, have the same dimensions and a matching colour
+        thumbnail, and then pass a full-resolution pixel comparison where
+        no 8x8 block differs by more than re-encoding noise. Matches are
+        not chained, so every member is close to the first one.
+        
+        Args:
+            image_files: List of image paths
+            threshold: Maximum dHash Hamming distance for near duplicates
+                (default None: exact matches only)
+        
+        Returns:
+            List of groups (lists of paths), largest file first in each group
+        """
+        # Exact pass: identical bytes share one group
+        exact_groups = {}
+        for img_file in image_files:
+            exact_groups.setdefault(self.get_content_hash(img_file), []).append(img_file)
+        groups = list(exact_groups.values())
+        
+        if np is None or threshold is None or threshold < 0 or len(groups) < 2:
+            return [sorted(g, key=self.get_file_size_kb, reverse=True) for g in groups]
+        
+        # Perceptual pass on one representative per exact group
+        fingerprints, hashed_groups, unhashed = [], [], []
+        for group in groups:
+            try:
+                fingerprint = self.get_image_fingerprint(group[0])
+            except Exception as e:
+                print(f"⚠️  Could not hash {group[0]}: {str(e)}")
+                fingerprint = None
+            if fingerprint is None:
+                unhashed.append(group)
+            else:
+                fingerprints.append(fingerprint)
+                hashed_groups.append(group)
+        if not fingerprints:
+            return [sorted(g, key=self.get_file_size_kb, reverse=True) for g in groups]
+        
+        hashes = np.array([f[0] for f in fingerprints], dtype=np.uint64)
+        popcount = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+        
+        merged = []
+        assigned = np.zeros(len(hashes), dtype=bool)
+        for i in range(len(hashes)):
+            if assigned[i]:
+                continue
+            assigned[i] = True
+            group = list(hashed_groups[i])
+            
+            # Hamming distances from this anchor only: O(N) memory per row
+            distances = popcount[(hashes ^ hashes[i]).view(np.uint8)].reshape(-1, 8).sum(axis=1)
+            for j in np.nonzero((distances <= threshold) & ~assigned)[0]:
+                if self.is_confirmed_duplicate(fingerprints[i], fingerprints[j],
+                                               hashed_groups[i][0], hashed_groups[j][0]):
+                    assigned[j] = True
+                    group.extend(hashed_groups[j])
+            merged.append(group)
+        
+        return [sorted(g, key=self.get_file_size_kb, reverse=True) for g in merged + unhashed]
+    
+    def is_confirmed_duplicate(self, first, second, first_path, second_path):
+        """Confirm a dHash match by dimensions, colour thumbnail and full-size pixels"""
+        if first[1] != second[1]:
+            return False
+        difference = np.abs(first[2] - second[2])
+        if (difference.mean() > self.duplicate_tolerance or
+                difference.max() > 8 * self.duplicate_tolerance):
+            return False
+        
+        # Small local changes (e.g. one figure on a document) vanish in
+        # thumbnails, so compare every 8x8 block of the decoded images
+        planes = []
+        for path in (first_path, second_path):
+            with Image.open(path) as img:
+                img = ImageOps.exif_transpose(img).convert('RGBA')
+                planes.append(np.asarray(img, dtype=np.int16))
+        difference = np.abs(planes[0] - planes[1]).mean(axis=2)
+        height, width = difference.shape
+        pad = ((0, -height % 8), (0, -width % 8))
+        blocks = np.pad(difference, pad).reshape((height + pad[0][1]) // 8, 8,
+                                                 (width + pad[1][1]) // 8, 8)
+        return blocks.mean(axis=(1, 3)).max() <= self.duplicate_block_tolerance
+    
+    def link_or_copy(self, source, destination):
+        """Hardlink source to destination, falling back to a copy"""
+        if os.path.exists(destination):
+            os.remove(destination)
+        try:
+            os.link(source, destination)
+        except OSError:
+            shutil.copy2(source, destination)
+    
+    def get_work_key(self, img_file):
+        """Get a stable, filesystem-safe key for a work unit"""
+        return hashlib.sha1(Path(img_file).name.encode('utf-8')).hexdigest()
+    
+    def get_size_bucket(self, img_file, bucket_count):
+        """Bucket a file by size, so byte-identical copies always share a bucket"""
+        return os.path.getsize(img_file) % bucket_count
+    
+    def select_shard(self, groups, shard_index, shard_count):
+        """Keep the work units that hash into shard shard_index of shard_count"""
+        if shard_count < 1 or not 0 <= shard_index < shard_count:
+            raise ValueError(f"Invalid shard {shard_index}/{shard_count}")
+        return [group for group in groups
+                if int(self.get_work_key(group[0]), 16) % shard_count == shard_index]
+    
+    def claim_work(self, queue_dir, key, worker_id, lease_seconds=300):
+        """
+        Claim a work unit in a shared queue directory
+        
+        A claim is a hardlink to a private file holding a unique token, which
+        fails if another worker already holds it. A claim whose mtime is older
+        than lease_seconds is stolen by renaming it away; the moved file is
+        then checked against the stale claim that was observed and put back
+        if it turns out to be a fresh or renewed one.
+        
+        Returns:
+            Claim token if this worker now owns the unit, otherwise None
+        """
+        queue_dir = Path(queue_dir)
+        done_file = queue_dir / 'done' / key
+        claim_file = queue_dir / 'claims' / key
+        if done_file.exists():
+            return None
+        
+        token = f"{worker_id} {uuid.uuid4().hex}\n"
+        private_file = queue_dir / 'tmp' / f"{key}.{worker_id}"
+        private_file.write_text(token)
+        try:
+            try:
+                os.link(private_file, claim_file)
+            except FileExistsError:
+                if not self.steal_stale_claim(queue_dir, key, worker_id, lease_seconds):
+                    return None
+                try:
+                    os.link(private_file, claim_file)
+                except FileExistsError:
+                    return None
+        finally:
+            os.remove(private_file)
+        
+        # The unit may have been finished while its claim was going stale
+        if done_file.exists():
+            self.release_work(queue_dir, key, token)
+            return None
+        return token
+    
+    def steal_stale_claim(self, queue_dir, key, worker_id, lease_seconds):
+        """Remove another worker's expired claim; True if it was removed"""
+        claim_file = Path(queue_dir) / 'claims' / key
+        try:
+            observed = claim_file.stat()
+            observed_token = claim_file.read_text()
+        except FileNotFoundError:
+            return True  # Released in the meantime, so it is free to claim
+        age = time.time() - observed.st_mtime
+        if age < lease_seconds:
+            return False
+        
+        stale_file = Path(queue_dir) / 'tmp' / f"{key}.stale.{worker_id}"
+        try:
+            os.rename(claim_file, stale_file)
+        except FileNotFoundError:
+            return False  # Another worker stole it first
+        
+        # Another stealer may have replaced the claim between our check and
+        # the rename, or its owner may have renewed it: then it is not stale
+        moved = stale_file.stat()
+        if (moved.st_ino != observed.st_ino or stale_file.read_text() != observed_token
+                or time.time() - moved.st_mtime < lease_seconds):
+            try:
+                os.link(stale_file, claim_file)
+            except FileExistsError:
+                print(f"⚠️  Could not restore claim for {key}; its owner will lose it")
+            os.remove(stale_file)
+            return False
+        
+        os.remove(stale_file)
+        print(f"⚠️  Stealing stale claim for {key} ({age:.0f}s old)")
+        return True
+    
+    def renew_claim(self, queue_dir, key, token, interval, stop_event):
+        """Refresh a claim's mtime every interval seconds until stop_event is set"""
+        claim_file = Path(queue_dir) / 'claims' / key
+        while not stop_event.wait(interval):
+            try:
+                if claim_file.read_text() != token:
+                    print(f"⚠️  Lost claim for {key} to another worker")
+                    return
+                os.utime(claim_file)
+            except FileNotFoundError:
+                print(f"⚠️  Lost claim for {key} to another worker")
+                return
+    
+    def mark_done(self, queue_dir, img_file, worker_id):
+        """Record that a file of a claimed unit has been processed"""
+        (Path(queue_dir) / 'done' / self.get_work_key(img_file)).write_text(f"{worker_id}\n")
+    
+    def get_pending_files(self, queue_dir, files):
+        """Get the files that no worker has processed yet"""
+        return [f for f in files
+                if not (Path(queue_dir) / 'done' / self.get_work_key(f)).exists()]
+    
+    def release_work(self, queue_dir, key, token=None):
+        """Remove the claim on a work unit (only if it still holds token, when given)"""
+        claim_file = Path(queue_dir) / 'claims' / key
+        try:
+            if token is None or claim_file.read_text() == token:
+                os.remove(claim_file)
+        except FileNotFoundError:
+            pass
+    
+    def get_run_dir(self, output_path, queue_dir=None, run_id='default'):
+        """Get the directory holding queue state and summaries for one run"""
+        return Path(queue_dir or Path(output_path) / '.shards') / run_id
+    
+    def merge_summaries(self, summary_dir):
+        """Merge the per-worker JSON summaries written by sharded batch runs"""
+        merged = {'workers': [], 'shards': [], 'total': 0, 'successful': 0, 'failed': [],
+                  'cpu_seconds': 0.0, 'cpu_saved': 0.0}
+        for summary_file in sorted(Path(summary_dir).glob('*.json')):
+            with open(summary_file) as f:
+                summary = json.load(f)
+            merged['workers'].append(summary['worker'])
+            if summary.get('shard'):
+                merged['shards'].append(summary['shard'])
+            for field in ['total', 'successful', 'cpu_seconds', 'cpu_saved']:
+                merged[field] += summary[field]
+            merged['failed'].extend(summary['failed'])
+        return merged
+    
+    def merge_batch_run(self, input_folder, output_folder=None, queue_dir=None, run_id='default'):
+        """
+        Merge the summaries of a finished sharded or queued batch run
+        
+        Run this once after every worker has exited. Missing shards,
+        unfinished queue claims and unprocessed files are reported.
+        
+        Returns:
+            Merged summary dict, also written to <run dir>/summary.json
+        """
+        input_path = Path(input_folder)
+        output_path = Path(output_folder) if output_folder else input_path / "optimized"
+        run_dir = self.get_run_dir(output_path, queue_dir, run_id)
+        merged = self.merge_summaries(run_dir / 'summaries')
+        merged['run_id'] = run_id
+        merged['expected'] = len(self.find_image_files(input_path))
+        
+        print(f"🧩 Combined summary for run '{run_id}' ({len(merged['workers'])} worker(s)):")
+        print(f"Successfully optimized: {merged['successful']}/{merged['total']} images")
+        print(f"CPU time: {merged['cpu_seconds']:.2f}s")
+        if merged['cpu_saved']:
+            print(f"Estimated CPU time saved by deduplication: {merged['cpu_saved']:.2f}s")
+        if merged['failed']:
+            print(f"Failed: {', '.join(merged['failed'])}")
+        
+        if merged['shards']:
+            shard_count = merged['shards'][0][1]
+            missing = sorted(set(range(shard_count)) - {index for index, _ in merged['shards']})
+            if missing:
+                print(f"⚠️  Missing shards: {', '.join(f'{i}/{shard_count}' for i in missing)}")
+        claims = list((run_dir / 'claims').glob('*')) if queue_dir else []
+        if claims:
+            print(f"⚠️  {len(claims)} unit(s) still claimed; a worker may still be running")
+        if merged['total'] != merged['expected']:
+            print(f"⚠️  Processed {merged['total']} of {merged['expected']} images")
+        
+        with open(run_dir / 'summary.json', 'w') as f:
+            json.dump(merged, f, indent=1)
+        return merged
+    
+    def find_image_files(self, input_path):
+        """Find all image files in a folder, sorted so every worker sees the same list"""
+        image_extensions = ['.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tiff', '.gif']
+        image_files = []
+        
+        for ext in image_extensions:
+            image_files.extend(Path(input_path).glob(f"*{ext}"))
+            image_files.extend(Path(input_path).glob(f"*{ext.upper()}"))
+        return sorted(set(image_files))
+    
+    def batch_optimize(self, input_folder, output_folder=None, dedupe=False,
+                       dedupe_threshold=None, shard=None, queue_dir=None, worker_id=None,
+                       lease_seconds=300, run_id='default', **kwargs):
+        """
+        Optimize all images in a folder
+        
+        Several processes or nodes can split one folder, either with a fixed
+        hash partition (shard) or by claiming work from a shared queue
+        directory (queue_dir). Each worker writes a summary for run_id;
+        merge_batch_run combines them once all workers have finished.
+        
+        Args:
+            input_folder: Folder containing images
+            output_folder: Output folder (default: <input>/optimized)
+            dedupe: Encode each group of duplicate images only once
+            dedupe_threshold: Maximum dHash distance for near duplicates (None: exact only)
+            shard: Tuple (index, count) to process only one hash partition
+            queue_dir: Shared directory for lock-free work claiming
+            worker_id: Name of this worker (default: <hostname>-<pid>)
+            lease_seconds: Age after which another worker's claim is stolen
+            run_id: Name of the run; queue state and summaries are kept per run
+            **kwargs: Options passed to optimize_image
+        
+        Returns:
+            Summary dict for this worker
+        """
         input_path = Path(input_folder)
         if not output_folder:
             output_folder = input_path / "optimized"
@@ -217,13 +1002,7 @@ class ImageOptimizer:
         output_path = Path(output_folder)
         output_path.mkdir(exist_ok=True)
         
-        # Find all image files
-        image_extensions = ['.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tiff']
-        image_files = []
-        
-        for ext in image_extensions:
-            image_files.extend(input_path.glob(f"*{ext}"))
-            image_files.extend(input_path.glob(f"*{ext.upper()}"))
+        image_files = self.find_image_files(input_path)
         
         if not image_files:
             print("No image files found in the specified folder.")
@@ -231,23 +1010,303 @@ class ImageOptimizer:
         
         print(f"Found {len(image_files)} image(s) to optimize...")
         
+        sharded = shard is not None or queue_dir is not None
+        if not worker_id:
+            worker_id = (f"shard-{shard[0]}-of-{shard[1]}" if shard is not None
+                         else f"{socket.gethostname()}-{os.getpid()}")
+        
+        # Work units are (key, files); duplicates are only looked for within
+        # a unit, so no worker has to hash the whole corpus. Units depend on
+        # each file alone (name, or size when deduplicating), never on its
+        # position in a listing, so workers that list the folder at
+        # different times still agree on them.
+        if shard is not None:
+            if dedupe:
+                if not 0 <= shard[0] < shard[1]:
+                    raise ValueError(f"Invalid shard {shard[0]}/{shard[1]}")
+                image_files = [f for f in image_files
+                               if self.get_size_bucket(f, shard[1]) == shard[0]]
+            else:
+                image_files = [group[0] for group in
+                               self.select_shard([[f] for f in image_files], *shard)]
+            print(f"Shard {shard[0]}/{shard[1]}: {len(image_files)} image(s)")
+        if queue_dir is not None:
+            if dedupe:
+                buckets = {}
+                for img_file in image_files:
+                    bucket = self.get_size_bucket(img_file, self.queue_buckets)
+                    buckets.setdefault(bucket, []).append(img_file)
+                units = [(f"size-{bucket:04d}", files) for bucket, files in sorted(buckets.items())]
+            else:
+                units = [(self.get_work_key(img_file), [img_file]) for img_file in image_files]
+            run_dir = self.get_run_dir(output_path, queue_dir, run_id)
+            for subdir in ['claims', 'done', 'tmp', 'summaries']:
+                (run_dir / subdir).mkdir(parents=True, exist_ok=True)
+            # Start at a worker-specific offset to reduce claim contention
+            offset = int(hashlib.sha1(worker_id.encode('utf-8')).hexdigest(), 16) % max(len(units), 1)
+            units = units[offset:] + units[:offset]
+        else:
+            units = [(None, image_files)] if image_files else []
+        
         successful = 0
-        for img_file in image_files:
-            print(f"\n📸 Processing: {img_file.name}")
-            output_file = output_path / img_file.name
+        total = 0
+        failed = []
+        cpu_seconds = 0.0
+        cpu_saved = 0.0
+        duplicate_groups = []
+        for key, unit in units:
+            token = None
+            if queue_dir is not None:
+                # Done markers are per file, so files added after a unit was
+                # first processed are picked up by a later claim of it
+                if not self.get_pending_files(run_dir, unit):
+                    continue
+                token = self.claim_work(run_dir, key, worker_id, lease_seconds)
+                if not token:
+                    continue
+                unit = self.get_pending_files(run_dir, unit)
+                # Keep the lease alive while this unit is being processed
+                stop_renewal = threading.Event()
+                renewal = threading.Thread(target=self.renew_claim, daemon=True,
+                                           args=(run_dir, key, token, lease_seconds / 3,
+                                                 stop_renewal))
+                renewal.start()
             
-            result = self.optimize_image(
-                input_path=str(img_file),
-                output_path=str(output_file),
-                **kwargs
-            )
+            if dedupe:
+                groups = self.find_duplicates(unit, dedupe_threshold)
+                print(f"Found {len(groups)} unique image(s) after duplicate detection")
+            else:
+                groups = [[img_file] for img_file in unit]
             
-            if result:
-                successful += 1
+            for group in groups:
+                img_file = group[0]
+                print(f"\n📸 Processing: {img_file.name}")
+                output_file = output_path / img_file.name
+                total += len(group)
+                
+                start = time.process_time()
+                result = self.optimize_image(
+                    input_path=str(img_file),
+                    output_path=str(output_file),
+                    **kwargs
+                )
+                elapsed = time.process_time() - start
+                cpu_seconds += elapsed
+                
+                if result:
+                    successful += 1
+                    for duplicate in group[1:]:
+                        self.link_or_copy(result, output_path / duplicate.name)
+                        successful += 1
+                    if len(group) > 1:
+                        duplicate_groups.append(group)
+                        cpu_saved += elapsed * (len(group) - 1)
+                else:
+                    failed.extend(str(f) for f in group)
+                if token:
+                    for done_file in group:
+                        self.mark_done(run_dir, done_file, worker_id)
+            
+            if token:
+                stop_renewal.set()
+                renewal.join()
+                self.release_work(run_dir, key, token)
+        
+        if duplicate_groups:
+            print(f"\n🔁 Duplicate groups ({len(duplicate_groups)}):")
+            for group in duplicate_groups:
+                print(f"  {group[0].name} <- {', '.join(d.name for d in group[1:])}")
+            print(f"Estimated CPU time saved: {cpu_saved:.2f}s")
+        
+        summary = {'worker': worker_id, 'run_id': run_id, 'shard': shard, 'total': total,
+                   'successful': successful, 'failed': failed, 'cpu_seconds': cpu_seconds,
+                   'cpu_saved': cpu_saved}
         
         print(f"\n🎉 Batch optimization complete!")
-        print(f"Successfully optimized: {successful}/{len(image_files)} images")
+        print(f"Successfully optimized: {successful}/{total} images")
         print(f"Output folder: {output_path}")
+        
+        if sharded:
+            summary_dir = self.get_run_dir(output_path, queue_dir, run_id) / 'summaries'
+            summary_dir.mkdir(parents=True, exist_ok=True)
+            with open(summary_dir / f"{worker_id}.json", 'w') as f:
+                json.dump(summary, f)
+            print(f"Worker summary written to {summary_dir}; run --merge once all workers finish")
+        
+        return summary
+    
+    def load_manifest(self, manifest_path):
+        """Load the watch-mode manifest of processed files"""
+        try:
+            with open(manifest_path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+    
+    def save_manifest(self, manifest_path, manifest):
+        """Write the watch-mode manifest atomically"""
+        temp_path = Path(f"{manifest_path}.tmp")
+        with open(temp_path, 'w') as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(temp_path, manifest_path)
+    
+    def watch_folder(self, input_folder, output_folder=None, interval=2.0, settle_seconds=2.0,
+                     workers=None, remove_deleted=False, max_cycles=None, **kwargs):
+        """
+        Keep a folder optimized, processing only new or changed images
+        
+        Each poll is a stat-only diff against a manifest of processed files
+        (size, mtime, content hash, parameters). A changed file is processed
+        once its size and mtime have stayed the same for settle_seconds, and
+        only if its content hash or the parameters differ from the manifest.
+        Work goes to a process pool that stays warm for the whole session.
+        
+        Args:
+            input_folder: Folder to watch
+            output_folder: Output folder (default: <input>/optimized)
+            interval: Seconds between polls
+            settle_seconds: How long a file must be unchanged before processing
+            workers: Number of worker processes (default: CPU count)
+            remove_deleted: Remove outputs whose inputs were deleted
+            max_cycles: Stop after this many polls (default: run until interrupted)
+            **kwargs: Options passed to optimize_image
+        """
+        input_path = Path(input_folder)
+        output_path = Path(output_folder) if output_folder else input_path / "optimized"
+        output_path.mkdir(exist_ok=True)
+        
+        manifest_path = output_path / '.manifest.json'
+        manifest = self.load_manifest(manifest_path)
+        params = json.loads(json.dumps(kwargs))
+        pending = {}  # name -> ((size, mtime_ns), time first seen with that stat)
+        in_flight = {}  # name -> (future, entry)
+        
+        print(f"👀 Watching {input_path} (every {interval}s, Ctrl+C to stop)")
+        cycles = 0
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            try:
+                while max_cycles is None or cycles < max_cycles:
+                    changed = False
+                    now = time.time()
+                    
+                    # Collect finished work; failures are recorded so they are
+                    # only retried once the file's size or mtime changes
+                    for name, (future, entry) in list(in_flight.items()):
+                        if not future.done():
+                            continue
+                        del in_flight[name]
+                        finished = self.finish_watch_entry(future, entry)
+                        if finished:
+                            manifest[name] = finished
+                            changed = True
+                    
+                    current = {}
+                    for img_file in self.find_image_files(input_path):
+                        try:
+                            stat = img_file.stat()
+                        except FileNotFoundError:
+                            continue
+                        current[img_file.name] = (img_file, (stat.st_size, stat.st_mtime_ns))
+                    
+                    for name, (img_file, file_stat) in current.items():
+                        entry = manifest.get(name)
+                        if name in in_flight or (entry and entry['params'] == params and
+                                                 (entry['size'], entry['mtime_ns']) == file_stat):
+                            pending.pop(name, None)
+                            continue
+                        
+                        # Debounce files that are still being written
+                        seen = pending.get(name)
+                        if seen is None or seen[0] != file_stat:
+                            pending[name] = (file_stat, now)
+                            continue
+                        if now - seen[1] < settle_seconds:
+                            continue
+                        del pending[name]
+                        
+                        digest = self.get_content_hash(img_file)
+                        new_entry = {'size': file_stat[0], 'mtime_ns': file_stat[1],
+                                     'hash': digest, 'params': params,
+                                     'output': str(output_path / name), 'failed': False}
+                        if entry and entry['hash'] == digest and entry['params'] == params:
+                            # Touched but not modified
+                            new_entry['failed'] = entry.get('failed', False)
+                            manifest[name] = new_entry
+                            changed = True
+                            continue
+                        
+                        print(f"\n📸 Queued: {name}")
+                        future = pool.submit(_optimize_in_worker, str(img_file),
+                                             new_entry['output'], kwargs)
+                        in_flight[name] = (future, new_entry)
+                    
+                    for name in set(manifest) - set(current):
+                        entry = manifest.pop(name)
+                        changed = True
+                        print(f"\n🗑️  Removed input: {name}")
+                        if remove_deleted and os.path.exists(entry['output']):
+                            os.remove(entry['output'])
+                            print(f"Deleted output: {entry['output']}")
+                    
+                    if changed:
+                        self.save_manifest(manifest_path, manifest)
+                    
+                    cycles += 1
+                    if max_cycles is None or cycles < max_cycles:
+                        time.sleep(interval)
+            except KeyboardInterrupt:
+                print("\n⏹️  Stopping watch...")
+            finally:
+                # Drop jobs that have not started; without a manifest entry
+                # they are picked up again on the next run
+                for future, _ in in_flight.values():
+                    future.cancel()
+                try:
+                    for name, (future, entry) in in_flight.items():
+                        finished = self.finish_watch_entry(future, entry)
+                        if finished:
+                            manifest[name] = finished
+                except KeyboardInterrupt:
+                    print("⏹️  Not recording running jobs; they will be retried on restart")
+                finally:
+                    self.save_manifest(manifest_path, manifest)
+    
+    def finish_watch_entry(self, future, entry):
+        """
+        Get the manifest entry for a finished watch-mode job, marking failures
+        
+        Returns None for cancelled or interrupted jobs, which are not
+        recorded so that they are retried.
+        """
+        if future.cancelled():
+            return None
+        try:
+            result = future.result()
+        except KeyboardInterrupt:
+            return None
+        except Exception as e:
+            print(f"❌ Worker failed: {str(e)}")
+            result = None
+        if not result:
+            print(f"⚠️  Recorded failure for {entry['output']}; retrying only when the input changes")
+        return dict(entry, failed=not result)
+
+
+_worker_optimizer = None
+
+
+def _init_worker():
+    """Create one optimizer per watch-mode worker process"""
+    global _worker_optimizer
+    # Ctrl+C reaches the whole process group; the parent decides what to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_optimizer = ImageOptimizer()
+
+
+def _optimize_in_worker(input_path, output_path, kwargs):
+    """Optimize one image in a watch-mode worker process"""
+    return _worker_optimizer.optimize_image(input_path=input_path, output_path=output_path,
+                                            **kwargs)
 
 def main():
     parser = argparse.ArgumentParser(description="Offline Image Optimizer")
@@ -256,11 +1315,37 @@ def main():
     parser.add_argument("-t", "--target-size", type=float, help="Target size in KB")
     parser.add_argument("-q", "--quality", type=int, default=85, help="Quality (1-100)")
     parser.add_argument("-w", "--max-width", type=int, help="Maximum width in pixels")
-    parser.add_argument("-h", "--max-height", type=int, help="Maximum height in pixels")
-    parser.add_argument("-f", "--format", choices=['JPEG', 'PNG', 'WEBP', 'AVIF'], 
+    parser.add_argument("-H", "--max-height", type=int, help="Maximum height in pixels")
+    parser.add_argument("-f", "--format", choices=['JPEG', 'PNG', 'WEBP', 'AVIF', 'GIF'], 
                        default='JPEG', help="Output format")
     parser.add_argument("-ar", "--aspect-ratio", help="Aspect ratio as 'width:height' (e.g., '16:9')")
+    parser.add_argument("-m", "--metadata", choices=['keep', 'strip', 'icc', 'copyright'],
+                       default='icc', help="Metadata policy (default: keep ICC profile only)")
+    parser.add_argument("-s", "--min-ssim", type=float,
+                       help="Quality floor: minimum SSIM (0-1) for target-size search (e.g., 0.95)")
     parser.add_argument("-b", "--batch", action="store_true", help="Batch process folder")
+    parser.add_argument("--dedupe", action="store_true",
+                       help="Encode byte-identical images in a batch only once")
+    parser.add_argument("--dedupe-near", type=int, metavar="DISTANCE",
+                       help="With --dedupe, also group pixel-verified near duplicates "
+                            "within this dHash distance (e.g., 4)")
+    parser.add_argument("--shard", help="Process only hash partition 'index/count' (e.g., '0/4')")
+    parser.add_argument("--queue", help="Shared directory for claiming batch work across processes")
+    parser.add_argument("--worker-id", help="Worker name for --shard/--queue summaries")
+    parser.add_argument("--lease", type=float, default=300,
+                       help="Seconds before another worker's claim is considered stale")
+    parser.add_argument("--run-id", default='default',
+                       help="Run name for --shard/--queue state and summaries")
+    parser.add_argument("--merge", action="store_true",
+                       help="Merge worker summaries of a finished --shard/--queue run")
+    parser.add_argument("--watch", action="store_true",
+                       help="Keep watching the folder and optimize new or changed images")
+    parser.add_argument("--interval", type=float, default=2.0, help="Seconds between watch polls")
+    parser.add_argument("--settle", type=float, default=2.0,
+                       help="Seconds a file must stay unchanged before it is processed")
+    parser.add_argument("--workers", type=int, help="Worker processes for watch mode")
+    parser.add_argument("--delete-outputs", action="store_true",
+                       help="In watch mode, remove outputs of deleted inputs")
     
     args = parser.parse_args()
     
@@ -274,18 +1359,65 @@ def main():
             print("❌ Invalid aspect ratio format. Use 'width:height' (e.g., '16:9')")
             return
     
+    # Parse shard
+    shard = None
+    if args.shard:
+        try:
+            index, count = map(int, args.shard.split('/'))
+            shard = (index, count)
+        except:
+            print("❌ Invalid shard format. Use 'index/count' (e.g., '0/4')")
+            return
+    
+    if args.min_ssim is not None and not 0 < args.min_ssim <= 1:
+        print("❌ Invalid SSIM floor. Use a value in (0, 1] (e.g., 0.95)")
+        return
+    
     optimizer = ImageOptimizer()
     
-    if args.batch or os.path.isdir(args.input):
+    if args.merge:
+        optimizer.merge_batch_run(
+            input_folder=args.input,
+            output_folder=args.output,
+            queue_dir=args.queue,
+            run_id=args.run_id
+        )
+    elif args.watch:
+        optimizer.watch_folder(
+            input_folder=args.input,
+            output_folder=args.output,
+            interval=args.interval,
+            settle_seconds=args.settle,
+            workers=args.workers,
+            remove_deleted=args.delete_outputs,
+            target_size_kb=args.target_size,
+            quality=args.quality,
+            max_width=args.max_width,
+            max_height=args.max_height,
+            output_format=args.format,
+            aspect_ratio=aspect_ratio,
+            metadata=args.metadata,
+            min_ssim=args.min_ssim
+        )
+    elif args.batch or os.path.isdir(args.input):
         optimizer.batch_optimize(
             input_folder=args.input,
             output_folder=args.output,
+            dedupe=args.dedupe,
+            dedupe_threshold=args.dedupe_near,
+            shard=shard,
+            queue_dir=args.queue,
+            worker_id=args.worker_id,
+            lease_seconds=args.lease,
+            run_id=args.run_id,
             target_size_kb=args.target_size,
             quality=args.quality,
             max_width=args.max_width,
             max_height=args.max_height,
             output_format=args.format,
-            aspect_ratio=aspect_ratio
+            aspect_ratio=aspect_ratio,
+            metadata=args.metadata,
+            min_ssim=args.min_ssim
         )
     else:
         optimizer.optimize_image(
@@ -296,7 +1428,9 @@ def main():
             max_width=args.max_width,
             max_height=args.max_height,
             output_format=args.format,
-            aspect_ratio=aspect_ratio
+            aspect_ratio=aspect_ratio,
+            metadata=args.metadata,
+            min_ssim=args.min_ssim
         )
 
 if __name__ == "__main__":
@@ -325,7 +1459,7 @@ if __name__ == "__main__":
             target_kb = input("Target size in KB (press Enter to skip): ").strip()
             target_kb = float(target_kb) if target_kb else None
             
-            format_choice = input("Output format (JPEG/PNG/WEBP/AVIF) [JPEG]: ").strip().upper()
+            format_choice = input("Output format (JPEG/PNG/WEBP/AVIF/GIF) [JPEG]: ").strip().upper()
             if not format_choice:
                 format_choice = 'JPEG'
             
@@ -0,0 +1,53 @@
+import sys
+import contextlib
+import io
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from image_optimizer import ImageOptimizer
+
+
+def make_transparent_gif(path, **kwargs):
+    frames = []
+    for i in range(6):
+        frame = Image.new('RGBA', (64, 64), (0, 0, 0, 0))
+        ImageDraw.Draw(frame).rectangle((10 + i * 5, 10, 30 + i * 5, 30), fill=(255, 0, 0, 255))
+        frames.append(frame)
+    frames[0].save(path, save_all=True, append_images=frames[1:], duration=50, disposal=2,
+                   **kwargs)
+
+
+def optimize(optimizer, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return optimizer.optimize_image(*args, **kwargs)
+
+
+def test_gif_keeps_transparency_and_play_once(tmp_path):
+    make_transparent_gif(tmp_path / 'in.gif')
+
+    result = optimize(ImageOptimizer(), tmp_path / 'in.gif', tmp_path / 'out.gif',
+                      output_format='GIF')
+    with Image.open(result) as img:
+        assert img.n_frames == 6
+        assert 'loop' not in img.info
+        img.seek(5)
+        frame = img.convert('RGBA')
+        assert frame.getpixel((0, 0))[3] == 0
+        assert frame.getpixel((12, 20))[3] == 0  # First frame's rectangle was cleared
+        assert frame.getpixel((45, 20)) == (255, 0, 0, 255)
+
+
+def test_animation_over_pixel_budget_is_refused_unless_sampled(tmp_path):
+    make_transparent_gif(tmp_path / 'in.gif', loop=0)
+    optimizer = ImageOptimizer()
+    optimizer.max_animation_pixels = 64 * 64 * 3
+
+    assert optimize(optimizer, tmp_path / 'in.gif', tmp_path / 'out.webp',
+                    output_format='WEBP') is None
+    result = optimize(optimizer, tmp_path / 'in.gif', tmp_path / 'out.webp',
+                      output_format='WEBP', target_size_kb=50)
+    with Image.open(result) as img:
+        assert img.n_frames <= 3
@@ -0,0 +1,60 @@
+import os
+import sys
+import shutil
+import contextlib
+import io
+from pathlib import Path
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from image_optimizer import ImageOptimizer
+
+
+def make_invoice(path, total):
+    img = Image.new('RGB', (800, 1000), 'white')
+    draw = ImageDraw.Draw(img)
+    for line in range(20):
+        draw.text((50, 50 + line * 40), f"Line {line} item qty 3 price 19.99", fill='black')
+    draw.text((50, 900), f"TOTAL: {total}", fill='black')
+    img.save(path)
+    return img
+
+
+def group_names(groups):
+    return sorted(sorted(path.name for path in group) for group in groups)
+
+
+def test_similar_documents_are_not_grouped(tmp_path):
+    make_invoice(tmp_path / 'invoice_a.png', '1234.00')
+    make_invoice(tmp_path / 'invoice_b.png', '9234.00')
+    files = sorted(tmp_path.glob('*.png'))
+
+    groups = ImageOptimizer().find_duplicates(files, threshold=4)
+    assert group_names(groups) == [['invoice_a.png'], ['invoice_b.png']]
+
+
+def test_copies_and_resaves_are_grouped_when_opted_in(tmp_path):
+    invoice = make_invoice(tmp_path / 'invoice.png', '1234.00')
+    shutil.copy(tmp_path / 'invoice.png', tmp_path / 'invoice_copy.png')
+    invoice.save(tmp_path / 'invoice_resave.jpg', quality=90)
+    files = sorted(tmp_path.iterdir())
+    optimizer = ImageOptimizer()
+
+    # Exact matching only by default
+    assert group_names(optimizer.find_duplicates(files)) == [
+        ['invoice.png', 'invoice_copy.png'], ['invoice_resave.jpg']]
+    assert group_names(optimizer.find_duplicates(files, threshold=4)) == [
+        ['invoice.png', 'invoice_copy.png', 'invoice_resave.jpg']]
+
+
+def test_batch_does_not_link_different_documents(tmp_path):
+    make_invoice(tmp_path / 'invoice_a.png', '1234.00')
+    make_invoice(tmp_path / 'invoice_b.png', '9234.00')
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        ImageOptimizer().batch_optimize(tmp_path, tmp_path / 'out', dedupe=True,
+                                        dedupe_threshold=4, output_format='PNG')
+    outputs = [os.stat(tmp_path / 'out' / name) for name in ['invoice_a.png', 'invoice_b.png']]
+    assert outputs[0].st_ino != outputs[1].st_ino
@@ -0,0 +1,38 @@
+import sys
+import contextlib
+import io
+from pathlib import Path
+
+from PIL import Image, ImageCms
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from image_optimizer import ImageOptimizer
+
+
+def optimize(*args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        result = ImageOptimizer().optimize_image(*args, **kwargs)
+    return result, output.getvalue()
+
+
+def test_profile_dropped_when_conversion_changes_color_space(tmp_path):
+    cmyk_profile = b'\0' * 16 + b'CMYK' + b'fakeCMYKprofile' * 20
+    Image.new('CMYK', (32, 32)).save(tmp_path / 'print.jpg', icc_profile=cmyk_profile)
+
+    result, _ = optimize(tmp_path / 'print.jpg', tmp_path / 'out.jpg', output_format='JPEG')
+    with Image.open(result) as img:
+        assert img.mode == 'RGB'
+        assert not img.info.get('icc_profile')
+
+
+def test_rgb_profile_kept_and_png_size_reported_compressed(tmp_path):
+    srgb = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+    Image.new('RGB', (32, 32)).save(tmp_path / 'photo.jpg', icc_profile=srgb)
+
+    result, output = optimize(tmp_path / 'photo.jpg', tmp_path / 'out.png', output_format='PNG')
+    with Image.open(result) as img:
+        assert img.info['icc_profile'] == srgb
+    metadata_kb = float(output.split('Metadata: ')[1].split(' KB')[0])
+    assert metadata_kb < len(srgb) / 1024
+    assert metadata_kb <= ImageOptimizer().get_file_size_kb(result)
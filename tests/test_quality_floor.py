@@ -0,0 +1,78 @@
+import sys
+import contextlib
+import io
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from image_optimizer import ImageOptimizer
+from test_animation import make_transparent_gif
+
+
+def make_texture(width, height):
+    noise = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return Image.fromarray(noise).filter(ImageFilter.GaussianBlur(1))
+
+
+def full_resolution_ssim(optimizer, source, result):
+    with Image.open(result) as img:
+        candidate = np.asarray(img.convert('L'), dtype=np.float64)
+    reference = np.asarray(source.convert('L'), dtype=np.float64)
+    return optimizer.compute_ssim(reference, candidate)
+
+
+def optimize(optimizer, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        result = optimizer.optimize_image(*args, **kwargs)
+    return result, output.getvalue()
+
+
+def test_ssim_of_identical_and_degraded_planes():
+    optimizer = ImageOptimizer()
+    plane = np.asarray(make_texture(64, 64).convert('L'), dtype=np.float64)
+    noise = np.random.default_rng(1).normal(0, 1, plane.shape)
+
+    assert optimizer.compute_ssim(plane, plane) == 1.0
+    assert 1.0 > optimizer.compute_ssim(plane, plane + noise * 5) > \
+        optimizer.compute_ssim(plane, plane + noise * 25)
+    # Row bands give the same score as a single pass
+    assert abs(optimizer.compute_ssim(plane, plane + noise * 5, band_rows=10) -
+               optimizer.compute_ssim(plane, plane + noise * 5, band_rows=1000)) < 1e-9
+
+
+def test_floor_binds_on_large_textured_image(tmp_path):
+    optimizer = ImageOptimizer()
+    source = make_texture(3000, 2000)
+    source.save(tmp_path / 'in.png')
+
+    result, _ = optimize(optimizer, tmp_path / 'in.png', tmp_path / 'out.jpg',
+                         output_format='JPEG', target_size_kb=1, min_ssim=0.9)
+    assert full_resolution_ssim(optimizer, source, result) >= 0.89
+
+
+def test_lossless_format_is_encoded_once(tmp_path, monkeypatch):
+    optimizer = ImageOptimizer()
+    make_texture(64, 64).save(tmp_path / 'in.png')
+    qualities = []
+    encode_candidate = optimizer.encode_candidate
+
+    def record(img, quality, *args):
+        qualities.append(quality)
+        return encode_candidate(img, quality, *args)
+
+    monkeypatch.setattr(optimizer, 'encode_candidate', record)
+    optimize(optimizer, tmp_path / 'in.png', tmp_path / 'out.png', output_format='PNG',
+             min_ssim=0.95)
+    assert len(qualities) == 1
+
+
+def test_floor_on_animation_is_reported_as_ignored(tmp_path):
+    make_transparent_gif(tmp_path / 'in.gif')
+
+    result, output = optimize(ImageOptimizer(), tmp_path / 'in.gif', tmp_path / 'out.gif',
+                              output_format='GIF', min_ssim=0.95)
+    assert result
+    assert 'not supported for animations' in output
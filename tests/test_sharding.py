@@ -0,0 +1,142 @@
+import os
+import sys
+import time
+import contextlib
+import multiprocessing
+from pathlib import Path
+from unittest import mock
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import image_optimizer
+from image_optimizer import ImageOptimizer
+
+WORKERS = 4
+IMAGES = 24
+
+
+class SlowOptimizer(ImageOptimizer):
+    """Optimizer whose units outlast a short lease, to exercise renewal"""
+
+    def optimize_image(self, *args, **kwargs):
+        time.sleep(0.3)
+        return super().optimize_image(*args, **kwargs)
+
+
+def make_corpus(folder):
+    folder.mkdir()
+    for i in range(IMAGES):
+        Image.new('RGB', (64, 48), (i * 10, 255 - i * 10, 128)).save(folder / f"img{i:02d}.png")
+
+
+def run_worker(optimizer_class, input_folder, output_folder, options):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        optimizer_class().batch_optimize(input_folder, output_folder, quality=60, **options)
+
+
+def run_workers(optimizer_class, input_folder, output_folder, options_list):
+    processes = [multiprocessing.Process(target=run_worker,
+                                         args=(optimizer_class, input_folder, output_folder, options))
+                 for options in options_list]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(60)
+        assert process.exitcode == 0
+
+
+def test_shards_cover_corpus_once(tmp_path):
+    make_corpus(tmp_path / 'in')
+    run_workers(ImageOptimizer, tmp_path / 'in', tmp_path / 'out',
+                [{'shard': (i, WORKERS)} for i in range(WORKERS)])
+
+    merged = ImageOptimizer().merge_batch_run(tmp_path / 'in', tmp_path / 'out')
+    assert merged['total'] == merged['successful'] == IMAGES
+    assert sorted(index for index, _ in merged['shards']) == list(range(WORKERS))
+    assert len(list((tmp_path / 'out').glob('*.png'))) == IMAGES
+
+
+def test_queue_processes_each_file_once_with_short_lease(tmp_path):
+    make_corpus(tmp_path / 'in')
+    queue_dir = tmp_path / 'queue'
+    # Units take longer than the lease, so only renewal prevents stealing
+    run_workers(SlowOptimizer, tmp_path / 'in', tmp_path / 'out',
+                [{'queue_dir': queue_dir, 'worker_id': f"w{i}", 'lease_seconds': 0.2}
+                 for i in range(WORKERS)])
+
+    merged = ImageOptimizer().merge_batch_run(tmp_path / 'in', tmp_path / 'out', queue_dir)
+    assert merged['total'] == merged['successful'] == IMAGES
+    assert len(list((queue_dir / 'default' / 'done').iterdir())) == IMAGES
+    assert not list((queue_dir / 'default' / 'claims').iterdir())
+
+
+def test_queue_dedupe_units_are_stable_across_listings(tmp_path):
+    make_corpus(tmp_path / 'in')
+    queue_dir = tmp_path / 'queue'
+    late_file = tmp_path / 'in' / 'img00.png'
+    late_file.rename(tmp_path / 'late.png')
+    run_worker(ImageOptimizer, tmp_path / 'in', tmp_path / 'out',
+               {'queue_dir': queue_dir, 'worker_id': 'early', 'dedupe': True})
+
+    # A worker listing the folder later sees one more file in some unit
+    (tmp_path / 'late.png').rename(late_file)
+    run_worker(ImageOptimizer, tmp_path / 'in', tmp_path / 'out',
+               {'queue_dir': queue_dir, 'worker_id': 'late', 'dedupe': True})
+
+    merged = ImageOptimizer().merge_batch_run(tmp_path / 'in', tmp_path / 'out', queue_dir)
+    assert merged['total'] == merged['successful'] == IMAGES
+    assert len(list((queue_dir / 'default' / 'done').iterdir())) == IMAGES
+    assert (tmp_path / 'out' / 'img00.png').exists()
+
+
+def test_runs_keep_separate_summaries(tmp_path):
+    make_corpus(tmp_path / 'in')
+    queue_dir = tmp_path / 'queue'
+    for run_id in ['first', 'second']:
+        run_worker(ImageOptimizer, tmp_path / 'in', tmp_path / 'out',
+                   {'queue_dir': queue_dir, 'run_id': run_id})
+
+    merged = ImageOptimizer().merge_batch_run(tmp_path / 'in', tmp_path / 'out', queue_dir,
+                                              run_id='second')
+    assert merged['total'] == IMAGES
+
+
+def make_queue(queue_dir):
+    for subdir in ['claims', 'done', 'tmp']:
+        (queue_dir / subdir).mkdir(parents=True)
+
+
+def test_stale_claim_is_stolen_and_fresh_claim_is_kept(tmp_path):
+    optimizer = ImageOptimizer()
+    make_queue(tmp_path)
+    (tmp_path / 'claims' / 'stale').write_text("dead\n")
+    os.utime(tmp_path / 'claims' / 'stale', (time.time() - 1000,) * 2)
+    (tmp_path / 'claims' / 'fresh').write_text("alive\n")
+
+    assert optimizer.claim_work(tmp_path, 'stale', 'a', lease_seconds=60)
+    assert not optimizer.claim_work(tmp_path, 'stale', 'b', lease_seconds=60)
+    assert not optimizer.claim_work(tmp_path, 'fresh', 'a', lease_seconds=60)
+
+
+def test_steal_restores_claim_replaced_by_another_stealer(tmp_path):
+    optimizer = ImageOptimizer()
+    make_queue(tmp_path)
+    claim_file = tmp_path / 'claims' / 'unit'
+    claim_file.write_text("dead\n")
+    os.utime(claim_file, (time.time() - 1000,) * 2)
+    real_rename = os.rename
+    tokens = {}
+
+    def rename_after_other_steal(source, destination):
+        # Worker a steals and re-claims the unit just before b's rename
+        with mock.patch.object(image_optimizer.os, 'rename', real_rename):
+            tokens['a'] = optimizer.claim_work(tmp_path, 'unit', 'a', lease_seconds=60)
+        real_rename(source, destination)
+
+    with mock.patch.object(image_optimizer.os, 'rename', rename_after_other_steal):
+        assert optimizer.claim_work(tmp_path, 'unit', 'b', lease_seconds=60) is None
+
+    assert tokens['a']
+    assert claim_file.read_text() == tokens['a']
@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import time
+import signal
+import contextlib
+import io
+import subprocess
+from pathlib import Path
+
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from image_optimizer import ImageOptimizer
+
+SCRIPT = Path(__file__).resolve().parent.parent / 'image_optimizer.py'
+
+
+def watch(folder, **kwargs):
+    options = dict(interval=0.05, settle_seconds=0, workers=1, max_cycles=3,
+                   output_format='PNG')
+    options.update(kwargs)
+    with contextlib.redirect_stdout(io.StringIO()) as output:
+        ImageOptimizer().watch_folder(folder, folder / 'out', **options)
+    return output.getvalue()
+
+
+def load_manifest(folder):
+    return json.loads((folder / 'out' / '.manifest.json').read_text())
+
+
+def test_only_new_or_modified_files_are_processed(tmp_path):
+    Image.new('RGB', (32, 32), 'red').save(tmp_path / 'a.png')
+    assert 'Queued: a.png' in watch(tmp_path)
+    assert not load_manifest(tmp_path)['a.png']['failed']
+
+    # Unchanged and touched-only files are skipped
+    assert 'Queued' not in watch(tmp_path)
+    os.utime(tmp_path / 'a.png', (time.time() + 5,) * 2)
+    assert 'Queued' not in watch(tmp_path)
+
+    Image.new('RGB', (32, 32), 'blue').save(tmp_path / 'a.png')
+    assert 'Queued: a.png' in watch(tmp_path)
+
+
+def test_unsettled_files_wait(tmp_path):
+    Image.new('RGB', (32, 32), 'red').save(tmp_path / 'a.png')
+    assert 'Queued' not in watch(tmp_path, settle_seconds=60)
+    assert 'a.png' not in load_manifest(tmp_path)
+
+
+def test_deleted_inputs_leave_manifest_and_optionally_outputs(tmp_path):
+    Image.new('RGB', (32, 32), 'red').save(tmp_path / 'a.png')
+    Image.new('RGB', (32, 32), 'blue').save(tmp_path / 'b.png')
+    watch(tmp_path)
+
+    os.remove(tmp_path / 'a.png')
+    os.remove(tmp_path / 'b.png')
+    watch(tmp_path, max_cycles=1)
+    assert load_manifest(tmp_path) == {}
+    assert (tmp_path / 'out' / 'a.png').exists()
+
+    Image.new('RGB', (32, 32), 'red').save(tmp_path / 'a.png')
+    watch(tmp_path)
+    os.remove(tmp_path / 'a.png')
+    watch(tmp_path, max_cycles=1, remove_deleted=True)
+    assert not (tmp_path / 'out' / 'a.png').exists()
+
+
+def test_failures_are_recorded_and_not_retried(tmp_path):
+    (tmp_path / 'broken.png').write_bytes(b'not an image')
+    watch(tmp_path)
+    assert load_manifest(tmp_path)['broken.png']['failed']
+    assert 'Queued' not in watch(tmp_path)
+
+
+def test_ctrl_c_saves_manifest_without_failing_interrupted_jobs(tmp_path):
+    for i in range(8):
+        Image.new('RGB', (2000, 2000), (i * 30, 0, 0)).save(tmp_path / f"img{i}.png")
+    process = subprocess.Popen(
+        [sys.executable, str(SCRIPT), str(tmp_path), '--watch', '-o', str(tmp_path / 'out'),
+         '-f', 'PNG', '--interval', '0.1', '--settle', '0', '--workers', '2'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, start_new_session=True)
+    deadline = time.time() + 60
+    while not (tmp_path / 'out' / '.manifest.json').exists() and time.time() < deadline:
+        time.sleep(0.05)
+
+    # Ctrl+C signals the whole foreground process group, workers included
+    os.killpg(process.pid, signal.SIGINT)
+    _, stderr = process.communicate(timeout=60)
+    assert process.returncode == 0
+    assert 'Traceback' not in stderr
+    manifest = load_manifest(tmp_path)
+    assert manifest
+    assert not any(entry['failed'] for entry in manifest.values())